@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+notifikace.py
+- společné odesílání Telegram zpráv pro ovladani_rele.py a stahni_data.py
+- jedna keep-alive session a jedno odesílací vlákno na pozadí
+- log() pro průběžné výpisy, které jde vypnout přes RELE_VERBOSE=0
+"""
+import atexit
+import os
+from concurrent.futures import ThreadPoolExecutor
+# ====== KONFIGURACE ======
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+HTTP_TIMEOUT = (3.05, 30) # (connect, read) – zaseknuté navazování spojení padá rychle
+VERBOSE = int(os.getenv("RELE_VERBOSE", "1")) # 0 = potlačit průběžné výpisy (chyby se tisknou vždy)
+_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/" # základ URL se skládá jednou
+# ====== SDÍLENÉ ZDROJE ======
+_session = None
+_pool = ThreadPoolExecutor(max_workers=1) # odesílání neblokuje volajícího
+atexit.register(_pool.shutdown, wait=True) # při ukončení se fronta dopošle
+def ziskej_session():
+    # requests se importuje až při prvním HTTP požadavku
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter, Retry
+        _session = requests.Session() # drží keep-alive spojení
+        _session.mount("https://", HTTPAdapter(
+            pool_connections=1, pool_maxsize=1,
+            max_retries=Retry(total=2, backoff_factor=0.5)))
+    return _session
+# ====== FUNKCE ======
+def log(*args):
+    # průběžné výpisy; při RELE_VERBOSE=0 se neprovede žádný zápis na stdout
+    if VERBOSE:
+        print(*args)
+def _odesli(metoda, data, files=None):
+    try:
+        resp = ziskej_session().post(_API_URL + metoda, data=data, files=files, timeout=HTTP_TIMEOUT)
+        if resp.status_code != 200:
+            print(f"Telegram API chyba: {resp.text}")
+    except Exception as e:
+        print(f"Telegram error [{type(e).__name__}]: {e}")
+def posli_text(text, parse_mode=None):
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        log("Telegram není nastaven — přeskočeno.")
+        return
+    data = {"chat_id": TELEGRAM_CHAT_ID, "text": text}
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+    _pool.submit(_odesli, "sendMessage", data)
+def posli_foto(buf, popis):
+    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        log("Telegram není nastaven — přeskočeno.")
+        return
+    # getbuffer() předá obsah BytesIO bez kopie; foto i popisek jdou jedním requestem
+    files = {"photo": ("graf.png", buf.getbuffer(), "image/png")}
+    data = {"chat_id": TELEGRAM_CHAT_ID, "caption": popis}
+    _pool.submit(_odesli, "sendPhoto", data, files)
@@ -7,15 +7,18 @@ ovladani_rele.py
 - předstih sepnutí se použije pouze při přechodu OFF → ON
 - ostatní změny proběhnou na začátku příslušné čtvrthodiny
 """
+import csv
+import functools
 import os
-import time
+import queue
+import signal
+import socket
 import threading
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import requests
-import pandas as pd
-import paho.mqtt.client as mqtt
+from notifikace import log, posli_text, ziskej_session
 # ====== KONFIGURACE ======
+PRG = ZoneInfo("Europe/Prague") # tz objekt se vytváří jednou, ne při každém datetime.now
 LIMIT_EUR = 13.0
 CENY_SOUBOR = "ceny_ote.csv"
 POSLEDNI_STAV_SOUBOR = "posledni_stav.txt"
@@ -29,21 +32,18 @@ MQTT_BASE = os.getenv("MQTT_BASE")
 GITHUB_TOKEN = os.getenv("MY_PAT")
 GITHUB_REPO = os.getenv("GITHUB_REPOSITORY")
 GITHUB_WORKFLOW = "ovladani_rele.yml"
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-POKUSY = 3
-CEKANI_SEKUND = 120
+CEKANI_SEKUND = (5, 15, 45) # eskalující čekání na echo; broker potvrzuje PUBACK zvlášť
+TVRDY_LIMIT_SEKUND = 90 * 60 # pojistka: běh pokrývá ~1 hodinu, zaseknutí nespálí víc CI minut
 # ====== HELPERS ======
+def zkontroluj_konfiguraci():
+    chybi = [nazev for nazev, hodnota in (("MQTT_BROKER", MQTT_BROKER),
+                                          ("MQTT_USER", MQTT_USER),
+                                          ("MQTT_PASS", MQTT_PASS),
+                                          ("MQTT_BASE", MQTT_BASE)) if not hodnota]
+    if chybi:
+        raise SystemExit(f"Chybí konfigurace: {', '.join(chybi)}")
 def send_telegram(text: str):
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        print("Telegram není nastaven — přeskočeno.")
-        return
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        data = {"chat_id": TELEGRAM_CHAT_ID,"text": text,"parse_mode": "HTML"}
-        requests.post(url, data=data, timeout=15)
-    except Exception as e:
-        print(f"Telegram error [{type(e).__name__}]: {e}")
+    posli_text(text, parse_mode="HTML")
 def spustit_dalsi_beh():
     if not GITHUB_TOKEN or not GITHUB_REPO:
         print("Chybí GITHUB_TOKEN nebo GITHUB_REPOSITORY – nelze spustit další běh.")
@@ -51,7 +51,7 @@ def spustit_dalsi_beh():
     try:
         url = f"https://api.github.com/repos/{GITHUB_REPO}/actions/workflows/{GITHUB_WORKFLOW}/dispatches"
         headers = {"Authorization": f"Bearer {GITHUB_TOKEN}","Accept": "application/vnd.github+json"}
-        requests.post(url, headers=headers, json={"ref": "main"}, timeout=30)
+        ziskej_session().post(url, headers=headers, json={"ref": "main"}, timeout=30)
     except Exception as e:
         print(f"Nelze spustit další workflow [{type(e).__name__}]: {e}")
 def commitni_posledni_stav():
@@ -63,42 +63,54 @@ def commitni_posledni_stav():
         os.system('git push || echo "Nic k pushnutí."')
     except Exception as e:
         print(f"Chyba při commitování [{type(e).__name__}]: {e}")
+@functools.lru_cache(maxsize=4)
+def _nacti_ceny_cached(soubor, mtime):
+    # mtime je součást klíče cache – změna souboru na disku cache zneplatní
+    with open(soubor, newline="", encoding="utf-8") as f:
+        return {int(radek["Ctvrthodina"]): float(radek["Cena (EUR/MWh)"])
+                for radek in csv.DictReader(f)}
 def nacti_ceny():
-    if not os.path.exists(CENY_SOUBOR):
+    try:
+        return _nacti_ceny_cached(CENY_SOUBOR, os.path.getmtime(CENY_SOUBOR))
+    except FileNotFoundError:
         raise FileNotFoundError(f"Soubor {CENY_SOUBOR} nenalezen.")
-    return pd.read_csv(CENY_SOUBOR)
 def nacti_posledni_stav():
-    if not os.path.exists(POSLEDNI_STAV_SOUBOR):
-        return None
     try:
-        with open(POSLEDNI_STAV_SOUBOR, "r", encoding="utf-8") as f:
+        with open(POSLEDNI_STAV_SOUBOR, "rb") as f:
             stav = f.read().strip()
-            return int(stav) if stav in ("0", "1") else None
+            return int(stav) if stav in (b"0", b"1") else None
     except Exception:
         return None
 def uloz_posledni_stav(stav: int):
+    # zápis do .tmp + os.replace = atomická výměna, pád uprostřed nepoškodí stav
     try:
-        with open(POSLEDNI_STAV_SOUBOR, "w", encoding="utf-8") as f:
-            f.write(str(stav))
+        tmp = POSLEDNI_STAV_SOUBOR + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, b"1" if stav else b"0")
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, POSLEDNI_STAV_SOUBOR)
     except Exception as e:
         print(f"Nelze zapsat {POSLEDNI_STAV_SOUBOR} [{type(e).__name__}]: {e}")
 # ====== ŘÍZENÍ ČASU A CENY ======
-def urci_rizenou_ctvrthodinu(predstih=False):
-    now = datetime.now(ZoneInfo("Europe/Prague"))
+def urci_rizenou_ctvrthodinu(predstih=False, now=None):
+    if now is None:
+        now = datetime.now(PRG)
     if predstih:
         cil = now + timedelta(minutes=PREDSTIH_MINUT)
     else:
         cil = now
     return cil.hour * 4 + cil.minute // 15 + 1
-def je_cena_pod_limitem(df, predstih=False):
-    ctvrthodina_index = urci_rizenou_ctvrthodinu(predstih)
-    row = df[df["Ctvrthodina"] == ctvrthodina_index]
-    if row.empty:
+def je_cena_pod_limitem(ceny, predstih=False, now=None):
+    ctvrthodina_index = urci_rizenou_ctvrthodinu(predstih, now)
+    cena = ceny.get(ctvrthodina_index)
+    if cena is None:
         raise Exception(f"Nenalezena cena pro periodu {ctvrthodina_index}.")
-    cena = float(row.iloc[0]["Cena (EUR/MWh)"])
     start_min = (ctvrthodina_index - 1) * 15
     end_min = start_min + 15
-    print(f"Cena {start_min//60:02d}:{start_min%60:02d}–{end_min//60:02d}:{end_min%60:02d}: {cena:.2f} EUR/MWh")
+    log(f"Cena {start_min//60:02d}:{start_min%60:02d}–{end_min//60:02d}:{end_min%60:02d}: {cena:.2f} EUR/MWh")
     return cena < LIMIT_EUR, cena
 def rozhodni_spusteni_cyklu():
     """
@@ -107,20 +119,25 @@ def rozhodni_spusteni_cyklu():
     poslední stav = OFF
     následující požadovaný stav = ON
     """
-    df = nacti_ceny()
+    ceny = nacti_ceny()
     posledni_stav = nacti_posledni_stav()
-    pod_limitem, cena = je_cena_pod_limitem(df, predstih=True)
+    pod_limitem, cena = je_cena_pod_limitem(ceny, predstih=True)
     pozadovany_stav = 1 if pod_limitem else 0
-    print(f"Poslední stav: {posledni_stav}")
-    print(f"Požadovaný stav následující čtvrthodiny: {pozadovany_stav}")
+    log(f"Poslední stav: {posledni_stav}")
+    log(f"Požadovaný stav následující čtvrthodiny: {pozadovany_stav}")
     if posledni_stav == 0 and pozadovany_stav == 1:
-        print("Detekován přechod OFF → ON, použije se předstih.")
+        log("Detekován přechod OFF → ON, použije se předstih.")
         return True
-    print("Předstih není potřeba.")
+    log("Předstih není potřeba.")
     return False
 # ====== MQTT ======
 class MqttRelaisController:
+    __slots__ = ("broker", "port", "username", "password", "base",
+                 "topic_set", "topic_get", "_inbox", "_awaiting",
+                 "_connected_event", "_subscribed_event", "client")
     def __init__(self, broker, port, username, password, base_topic):
+        # paho se importuje až při vytvoření controlleru, ne při startu čekání
+        import paho.mqtt.client as mqtt
         self.broker = broker
         self.port = port
         self.username = username
@@ -128,166 +145,212 @@ class MqttRelaisController:
         self.base = base_topic.rstrip("/")
         self.topic_set = f"{self.base}/2/set"
         self.topic_get = f"{self.base}/2/get"
-        self._lock = threading.Lock()
-        self._last_payload = None
-        self._confirm_event = threading.Event()
+        self._inbox = queue.Queue() # potvrzení stavu z vlákna paho do hlavního vlákna
+        self._awaiting = False # True jen po dobu čekání na potvrzení
         self._connected_event = threading.Event()
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        self._subscribed_event = threading.Event()
+        # stabilní client_id + trvalá session: po reconnectu broker zná odběr
+        # a doručí echo zařízení bez nového SUBSCRIBE
+        client_id = f"ovladani-rele-{self.username}"[:23]
+        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                                  client_id=client_id, clean_session=False)
         self.client.username_pw_set(self.username, self.password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.on_socket_open = self._on_socket_open
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
+        self.client.on_subscribe = self._on_subscribe
         self.client.on_message = self._on_message
+    def _on_socket_open(self, client, userdata, sock):
+        # vypnout Nagle – jednobajtové PUBLISH nečeká na delayed ACK;
+        # callback pokryje i sockety z automatických reconnectů
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     def _on_connect(self, client, userdata, flags, reason_code, properties):
         if reason_code == 0:
-            print(f"MQTT připojeno {self.broker}:{self.port}")
-            client.subscribe(self.topic_get)
+            log(f"MQTT připojeno {self.broker}:{self.port}")
+            if flags.session_present:
+                # broker navázal na uloženou session, odběr /get stále platí
+                self._subscribed_event.set()
+            else:
+                client.subscribe(self.topic_get, qos=1)
             self._connected_event.set()
         else:
             print(f"MQTT chyba reason_code={reason_code}")
+    def _on_subscribe(self, client, userdata, mid, reason_codes, properties):
+        self._subscribed_event.set()
     def _on_disconnect(self, client, userdata, reason_code, properties, reason_string):
-        print("MQTT odpojeno")
+        log("MQTT odpojeno")
         self._connected_event.clear()
+        self._subscribed_event.clear()
     def _on_message(self, client, userdata, msg):
+        if not self._awaiting: # mezi cykly potvrzení nikdo nečeká
+            return
+        # validace payloadu dřív než cokoli jiného – šum se zahodí bez výpisu
+        payload = msg.payload.strip() # bytes.strip nealokuje, pokud není co ořezat
+        if payload not in (b"0", b"1"):
+            print(f"MQTT {msg.topic}: neplatný payload {msg.payload!r}")
+            return
         if msg.retain:
-            print("Ignoruji retained zprávu.")
             return
-        payload = msg.payload.decode(errors="ignore").strip()
-        print(f"MQTT {msg.topic}: {payload}")
-        if payload in ("1", "0"):
-            with self._lock:
-                self._last_payload = payload
-                self._confirm_event.set()
-    def connect(self, timeout=10):
-        print(f"MQTT connect na {self.broker}:{self.port}")
-        self.client.connect(self.broker, self.port, keepalive=60)
+        stav = 1 if payload == b"1" else 0
+        log(f"MQTT {msg.topic}: {stav}")
+        self._inbox.put(stav)
+    def connect(self):
+        # neblokuje – handshake běží na pozadí, než se stihnou načíst ceny
+        log(f"MQTT connect na {self.broker}:{self.port}")
+        self.client.connect_async(self.broker, self.port, keepalive=30)
         self.client.loop_start()
+    def wait_connected(self, timeout=10):
         if not self._connected_event.wait(timeout):
             raise TimeoutError("MQTT broker nepotvrdil připojení.")
+        # publikovat až po SUBACK, jinak může echo zařízení předběhnout odběr
+        if not self._subscribed_event.wait(timeout):
+            raise TimeoutError("MQTT broker nepotvrdil odběr (SUBACK).")
     def disconnect(self):
         self.client.loop_stop()
         self.client.disconnect()
     def publish_and_wait_confirmation(self, desired_state, timeout_seconds):
-        with self._lock:
-            self._last_payload = None
-        self._confirm_event.clear()
-        print(f"Publikuji {desired_state} na {self.topic_set}")
-        self.client.publish(self.topic_set, desired_state)
-        if not self._confirm_event.wait(timeout_seconds):
-            print("Timeout — žádné potvrzení.")
-            return False
-        with self._lock:
-            return self._last_payload == desired_state
+        self.wait_connected(timeout=15)
+        while not self._inbox.empty(): # zahodit stará potvrzení z minulého pokusu
+            self._inbox.get_nowait()
+        self._awaiting = True
+        try:
+            log(f"Publikuji {desired_state} na {self.topic_set}")
+            # retain=True: zařízení po svém reconnectu dostane poslední žádaný stav
+            info = self.client.publish(self.topic_set, b"1" if desired_state else b"0",
+                                       qos=1, retain=True)
+            info.wait_for_publish(timeout=5)
+            if not info.is_published():
+                print("Broker nepotvrdil doručení (PUBACK).")
+                return False
+            try:
+                potvrzeni = self._inbox.get(timeout=timeout_seconds)
+            except queue.Empty:
+                if not self._connected_event.is_set():
+                    print("Timeout — spojení během čekání spadlo.")
+                else:
+                    print("Timeout — žádné potvrzení.")
+                return False
+            return potvrzeni == desired_state
+        finally:
+            self._awaiting = False
 # ====== HLAVNÍ LOGIKA ======
-def main_cycle(predstih=False):
-    ctl = None
+def main_cycle(ctl, predstih=False):
     try:
-        df = nacti_ceny()
-        pod_limitem, cena = je_cena_pod_limitem(df, predstih)
-        desired_payload = "1" if pod_limitem else "0"
-        desired_payload_int = int(desired_payload)
+        now = datetime.now(PRG) # jeden odečet času pro celý cyklus
+        ceny = nacti_ceny()
+        pod_limitem, cena = je_cena_pod_limitem(ceny, predstih, now)
+        pozadovany_stav = 1 if pod_limitem else 0
         posledni_stav = nacti_posledni_stav()
-        print(f"Poslední známý stav: {posledni_stav}")
-        print(f"Požadovaný stav relé: {desired_payload}")
-        akce_text = "zapnuto" if desired_payload == "1" else "vypnuto"
-        ctl = MqttRelaisController(MQTT_BROKER, MQTT_PORT, MQTT_USER, MQTT_PASS, MQTT_BASE)
-        ctl.connect(timeout=15)
+        log(f"Poslední známý stav: {posledni_stav}")
+        log(f"Požadovaný stav relé: {pozadovany_stav}")
+        if posledni_stav == pozadovany_stav:
+            # soubor drží poslední POTVRZENÝ stav – shoda znamená, že není co přepínat
+            log("Stav se nemění – publikace se přeskočí.")
+            return
+        akce_text = "zapnuto" if pozadovany_stav else "vypnuto"
         success = False
-        for pokus in range(1, POKUSY + 1):
-            print(f"--- Pokus {pokus}/{POKUSY} ---")
-            if ctl.publish_and_wait_confirmation(desired_payload, CEKANI_SEKUND):
+        for pokus, cekani in enumerate(CEKANI_SEKUND, 1):
+            log(f"--- Pokus {pokus}/{len(CEKANI_SEKUND)} ---")
+            if ctl.publish_and_wait_confirmation(pozadovany_stav, cekani):
                 success = True
-                cas = datetime.now(ZoneInfo("Europe/Prague")).strftime("%H:%M")
-                if posledni_stav != desired_payload_int:
-                    send_telegram(f"<b>Relé {akce_text}</b> ({cas}).")
-                else:
-                    print("Stav se nezměnil – Telegram se neposílá.")
-                uloz_posledni_stav(desired_payload_int)
                 break
-            print(f"Nepotvrzeno, pokus {pokus}")
-        if not success:
-            cas = datetime.now(ZoneInfo("Europe/Prague")).strftime("%H:%M")
+            log(f"Nepotvrzeno, pokus {pokus}")
+        cas = f"{datetime.now(PRG):%H:%M}" # jedno formátování času pro obě větve
+        if success:
+            send_telegram(f"<b>Relé {akce_text}</b> ({cas}).")
+            uloz_posledni_stav(pozadovany_stav)
+        else:
             send_telegram(f"<b>Relé nereaguje</b> ({cas}).")
     except Exception as e:
         print(f"Chyba [{type(e).__name__}]: {e}")
         send_telegram(f"Chyba v ovladani_rele.py [{type(e).__name__}]: {e}")
-    finally:
-        if ctl:
-            try:
-                ctl.disconnect()
-            except Exception:
-                pass
 # ====== ČASOVÉ FUNKCE ======
+_stop_evt = threading.Event()
+def _zpracuj_signal(signum, frame):
+    print(f"Zachycen signál {signal.Signals(signum).name} – ukončuji.")
+    _stop_evt.set()
+signal.signal(signal.SIGTERM, _zpracuj_signal)
+signal.signal(signal.SIGINT, _zpracuj_signal)
+def _zpracuj_alarm(signum, frame):
+    print("Překročen tvrdý časový limit běhu – ukončuji.")
+    send_telegram("<b>Ovládání relé překročilo časový limit</b> – běh ukončen.")
+    raise SystemExit(1)
+signal.signal(signal.SIGALRM, _zpracuj_alarm)
 def cekej_do_casoveho_bodu(target_dt):
-    while True:
-        now = datetime.now(ZoneInfo("Europe/Prague"))
-        delta = (target_dt - now).total_seconds()
-        if delta <= 0:
-            break
-        if delta > 240:
-            time.sleep(30)
-        elif delta > 60:
-            time.sleep(10)
-        else:
-            time.sleep(1)
+    delta = (target_dt - datetime.now(PRG)).total_seconds()
+    if delta > 0 and _stop_evt.wait(delta):
+        raise SystemExit(0) # signál přerušil čekání; atexit dopošle Telegram frontu
 def dalsi_ctvrthodina(now=None):
     if now is None:
-        now = datetime.now(ZoneInfo("Europe/Prague"))
+        now = datetime.now(PRG)
     minuta = ((now.minute // 15) + 1) * 15
     if minuta >= 60:
         return (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
     return now.replace(minute=minuta, second=0, microsecond=0)
 def dalsi_cela_hodina(now=None):
     if now is None:
-        now = datetime.now(ZoneInfo("Europe/Prague"))
+        now = datetime.now(PRG)
     return (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
 # ====== START PROGRAMU ======
 if __name__ == "__main__":
-    now = datetime.now(ZoneInfo("Europe/Prague"))
-    if now.minute <= DO_KDY_PLATI_NOVA_HODINA:
-        print("Workflow spuštěn v nové hodině – první cyklus se spustí ihned.")
-        main_cycle(predstih=False)
-    else:
-        next_quarter = dalsi_ctvrthodina(now)
-        rozhodovaci_cas = next_quarter - timedelta(minutes=PREDSTIH_MINUT)
-        if now < rozhodovaci_cas:
-            print(f"Čekám do rozhodovacího času {rozhodovaci_cas.strftime('%H:%M:%S')}")
-            cekej_do_casoveho_bodu(rozhodovaci_cas)
-            if rozhodni_spusteni_cyklu():
-                print("První cyklus spuštěn s předstihem.")
-                main_cycle(predstih=True)
-            else:
-                print("Předstih není potřeba, čekám na začátek čtvrthodiny.")
-                cekej_do_casoveho_bodu(next_quarter)
-                main_cycle(predstih=False)
+    zkontroluj_konfiguraci() # špatně nastavené prostředí spadne hned, ne až u brokeru
+    signal.alarm(TVRDY_LIMIT_SEKUND)
+    now = datetime.now(PRG)
+    # jedno MQTT spojení pro všechny cykly v hodině; připojuje se na pozadí
+    ctl = MqttRelaisController(MQTT_BROKER, MQTT_PORT, MQTT_USER, MQTT_PASS, MQTT_BASE)
+    ctl.connect()
+    try:
+        if now.minute <= DO_KDY_PLATI_NOVA_HODINA:
+            log("Workflow spuštěn v nové hodině – první cyklus se spustí ihned.")
+            main_cycle(ctl, predstih=False)
         else:
-            print("Jsme mezi rozhodovacím časem a začátkem čtvrthodiny.")
+            next_quarter = dalsi_ctvrthodina(now)
+            rozhodovaci_cas = next_quarter - timedelta(minutes=PREDSTIH_MINUT)
+            if now < rozhodovaci_cas:
+                log(f"Čekám do rozhodovacího času {rozhodovaci_cas.strftime('%H:%M:%S')}")
+                cekej_do_casoveho_bodu(rozhodovaci_cas)
+                if rozhodni_spusteni_cyklu():
+                    log("První cyklus spuštěn s předstihem.")
+                    main_cycle(ctl, predstih=True)
+                else:
+                    log("Předstih není potřeba, čekám na začátek čtvrthodiny.")
+                    cekej_do_casoveho_bodu(next_quarter)
+                    main_cycle(ctl, predstih=False)
+            else:
+                log("Jsme mezi rozhodovacím časem a začátkem čtvrthodiny.")
+                if rozhodni_spusteni_cyklu():
+                    log("OFF → ON potvrzeno, spouštím ihned.")
+                    main_cycle(ctl, predstih=False)
+                else:
+                    log("Předstih není potřeba, čekám na začátek čtvrthodiny.")
+                    cekej_do_casoveho_bodu(next_quarter)
+                    main_cycle(ctl, predstih=False)
+        # ====== DALŠÍ CYKLY V HODINĚ ======
+        while True:
+            now = datetime.now(PRG)
+            next_cycle = dalsi_ctvrthodina(now)
+            if next_cycle.hour != now.hour:
+                break
+            rozhodovaci_cas = next_cycle - timedelta(minutes=PREDSTIH_MINUT)
+            log(f"Čekám na rozhodnutí před cyklem {next_cycle.strftime('%H:%M:%S')}")
+            cekej_do_casoveho_bodu(rozhodovaci_cas)
             if rozhodni_spusteni_cyklu():
-                print("OFF → ON potvrzeno, spouštím ihned.")
-                main_cycle(predstih=False)
+                log("Cyklus spuštěn s předstihem.")
+                main_cycle(ctl, predstih=True)
             else:
-                print("Předstih není potřeba, čekám na začátek čtvrthodiny.")
-                cekej_do_casoveho_bodu(next_quarter)
-                main_cycle(predstih=False)
-    # ====== DALŠÍ CYKLY V HODINĚ ======
-    while True:
-        now = datetime.now(ZoneInfo("Europe/Prague"))
-        next_cycle = dalsi_ctvrthodina(now)
-        if next_cycle.hour != now.hour:
-            break
-        rozhodovaci_cas = next_cycle - timedelta(minutes=PREDSTIH_MINUT)
-        print(f"Čekám na rozhodnutí před cyklem {next_cycle.strftime('%H:%M:%S')}")
-        cekej_do_casoveho_bodu(rozhodovaci_cas)
-        if rozhodni_spusteni_cyklu():
-            print("Cyklus spuštěn s předstihem.")
-            main_cycle(predstih=True)
-        else:
-            print(f"Čekám na začátek čtvrthodiny {next_cycle.strftime('%H:%M:%S')}")
-            cekej_do_casoveho_bodu(next_cycle)
-            main_cycle(predstih=False)
+                log(f"Čekám na začátek čtvrthodiny {next_cycle.strftime('%H:%M:%S')}")
+                cekej_do_casoveho_bodu(next_cycle)
+                main_cycle(ctl, predstih=False)
+    finally:
+        try:
+            ctl.disconnect()
+        except Exception:
+            pass
     # ====== SPUŠTĚNÍ DALŠÍHO WORKFLOW ======
-now = datetime.now(ZoneInfo("Europe/Prague"))
-commitni_posledni_stav()
-trigger_time = dalsi_cela_hodina(now) - timedelta(minutes=12)
-print(f"Čekám do spuštění dalšího workflow {trigger_time.strftime('%H:%M:%S')}")
-cekej_do_casoveho_bodu(trigger_time)
-spustit_dalsi_beh()
+    now = datetime.now(PRG)
+    commitni_posledni_stav()
+    trigger_time = dalsi_cela_hodina(now) - timedelta(minutes=12)
+    log(f"Čekám do spuštění dalšího workflow {trigger_time.strftime('%H:%M:%S')}")
+    cekej_do_casoveho_bodu(trigger_time)
+    spustit_dalsi_beh()
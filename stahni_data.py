@@ -1,14 +1,13 @@
 # -*- coding: utf-8 -*-
-import requests
+import numpy as np
 import pandas as pd
 import os
+import random
 import time
 import io
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 from zoneinfo import ZoneInfo
 from datetime import datetime
+from notifikace import HTTP_TIMEOUT, log, posli_text, posli_foto, ziskej_session
 # ====== KONFIGURAČNÍ PROMĚNNÉ ======
 LIMIT_EUR = float(
     os.getenv(
@@ -17,78 +16,110 @@ LIMIT_EUR = float(
     )
 )
 dnes = datetime.now(ZoneInfo("Europe/Prague"))
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-HTTP_TIMEOUT = 30
+LAST_MODIFIED_SOUBOR = ".ote_last_modified"
+# celá URL jedním strftime – bez tří dílčích mezivýsledků
+OTE_URL = dnes.strftime(
+    "https://www.ote-cr.cz/pubweb/"
+    "attachments/01/%Y/"
+    "month%m/"
+    "day%d/"
+    "DT_15MIN_%d_%m_%Y_CZ.xlsx"
+)
 # ====== FUNKCE ======
+def _nacti_last_modified():
+    # značka platí jen pro stejnou URL – adresa obsahuje datum
+    try:
+        with open(LAST_MODIFIED_SOUBOR, encoding="utf-8") as f:
+            ulozena_url, znacka = f.read().split("\n", 1)
+        return znacka.strip() if ulozena_url == OTE_URL else None
+    except Exception:
+        return None
+def _uloz_last_modified(znacka):
+    tmp = LAST_MODIFIED_SOUBOR + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(f"{OTE_URL}\n{znacka}")
+    os.replace(tmp, LAST_MODIFIED_SOUBOR)
 def ziskej_data_z_ote(
     max_pokusu=5,
-    cekani=300
+    cekani=15
 ):
     """
     Stáhne dnešní SPOT ceny z OTE.
     Opakuje při neúspěchu.
+    Vrací (df, značka Last-Modified);
+    (None, None), pokud se soubor od minulého stažení nezměnil.
     """
-    den = dnes.strftime("%d")
-    mesic = dnes.strftime("%m")
-    rok = dnes.strftime("%Y")
-    url = (
-        f"https://www.ote-cr.cz/pubweb/"
-        f"attachments/01/{rok}/"
-        f"month{mesic}/"
-        f"day{den}/"
-        f"DT_15MIN_{den}_{mesic}_{rok}_CZ.xlsx"
-    )
     for pokus in range(
         1,
         max_pokusu + 1
     ):
         try:
-            print(
+            log(
                 f"⬇️ Pokus {pokus}: "
-                f"stahuji data z {url}"
-            )
-            df = pd.read_excel(
-                url,
-                skiprows=22,
-                usecols="A,C",
-                engine="openpyxl",
-                storage_options=None
+                f"stahuji data z {OTE_URL}"
             )
-            df.columns = [
-                "Ctvrthodina",
-                "Cena (EUR/MWh)"
-            ]
-            df.dropna(inplace=True)
-            df["Ctvrthodina"] = (
-                pd.to_numeric(
-                    df["Ctvrthodina"],
-                    errors="coerce"
-                )
-                .fillna(0)
-                .astype(int)
+            # sešit se stáhne přes keep-alive session a čte v read_only
+            # režimu – openpyxl nestaví celou mřížku buněk v paměti
+            from openpyxl import load_workbook
+            hlavicky = {}
+            znacka = _nacti_last_modified()
+            if znacka and os.path.exists("ceny_ote.csv"):
+                hlavicky["If-Modified-Since"] = znacka
+            resp = ziskej_session().get(
+                OTE_URL,
+                headers=hlavicky,
+                timeout=HTTP_TIMEOUT
             )
-            df["Cena (EUR/MWh)"] = (
-                pd.to_numeric(
-                    df["Cena (EUR/MWh)"]
-                    .astype(str)
-                    .str.replace(",", "."),
-                    errors="coerce"
-                )
+            if resp.status_code == 304:
+                log("ℹ️ OTE data beze změny (304).")
+                return None, None
+            resp.raise_for_status()
+            wb = load_workbook(
+                io.BytesIO(resp.content),
+                read_only=True,
+                data_only=True
             )
-            df = df[
-                df["Ctvrthodina"] >= 1
-            ]
-            return df
+            try:
+                ctvrthodiny = []
+                ceny = []
+                for radek in wb.active.iter_rows(
+                    min_row=23,
+                    max_col=3,
+                    values_only=True
+                ):
+                    try:
+                        ctvrt = int(radek[0])
+                        cena = float(
+                            str(radek[2]).replace(",", ".")
+                        )
+                    except (TypeError, ValueError):
+                        continue
+                    if ctvrt >= 1:
+                        ctvrthodiny.append(ctvrt)
+                        ceny.append(cena)
+            finally:
+                wb.close()
+            # značku si uloží až stahni_data() po úspěšném zápisu CSV
+            return pd.DataFrame({
+                "Ctvrthodina": ctvrthodiny,
+                "Cena (EUR/MWh)": ceny
+            }), resp.headers.get("Last-Modified")
         except Exception as e:
             print(f"⚠️ Chyba: {e}")
             if pokus < max_pokusu:
-                print(
+                # exponenciální backoff s jitterem – první pokus po ~15 s,
+                # náhodná složka rozhodí souběžné runnery
+                pauza = min(
+                    600,
+                    cekani * 2 ** (pokus - 1)
+                    + random.uniform(0, cekani)
+                )
+                log(
                     f"⏳ Čekám "
-                    f"{cekani}s "
+                    f"{pauza:.0f}s "
                     f"před dalším pokusem…"
                 )
-                time.sleep(cekani)
+                time.sleep(pauza)
     raise Exception(
         "❌ Nepodařilo se "
         "stáhnout data z OTE."
@@ -98,19 +129,29 @@ def uloz_csv(
     soubor="ceny_ote.csv"
 ):
     tmp = soubor + ".tmp"
-    df.to_csv(
-        tmp,
-        index=False
-    )
+    # 96 řádků se zapíše napřímo – plný pandas CSV writer tu není potřeba
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("Ctvrthodina,Cena (EUR/MWh)\n")
+        f.writelines(
+            f"{ctvrt},{cena}\n"
+            for ctvrt, cena in zip(
+                df["Ctvrthodina"],
+                df["Cena (EUR/MWh)"]
+            )
+        )
     os.replace(
         tmp,
         soubor
     )
-    print(
+    log(
         f"💾 Data uložena do "
         f"{soubor}"
     )
 def vytvor_graf(df):
+    # matplotlib se importuje až tady – den bez grafu jeho drahý import přeskočí
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(figsize=(8, 4))
     ax.plot(
         df["Ctvrthodina"],
@@ -137,7 +178,8 @@ def vytvor_graf(df):
     plt.tight_layout()
     plt.savefig(
         buf,
-        format="png"
+        format="png",
+        pil_kwargs={"optimize": True}
     )
     buf.seek(0)
     plt.close(fig)
@@ -147,10 +189,12 @@ def zjisti_intervaly_pod_limitem(df):
     Vrátí seznam intervalů,
     kdy je cena pod limitem.
     """
-    pod = df[
-        df["Cena (EUR/MWh)"] < LIMIT_EUR
-    ]["Ctvrthodina"].tolist()
-    intervaly = []
+    pod = df.loc[
+        df["Cena (EUR/MWh)"] < LIMIT_EUR,
+        "Ctvrthodina"
+    ].to_numpy()
+    if pod.size == 0:
+        return []
     def ctvrthodina_na_cas(index):
         start = (index - 1) * 15
         hod = start // 60
@@ -159,115 +203,42 @@ def zjisti_intervaly_pod_limitem(df):
             f"{hod:02d}:"
             f"{minuty:02d}"
         )
-    if pod:
-        start = pod[0]
-        prev = pod[0]
-        for i in pod[1:]:
-            if i == prev + 1:
-                prev = i
-            else:
-                intervaly.append(
-                    f"{ctvrthodina_na_cas(start)}"
-                    f"–"
-                    f"{ctvrthodina_na_cas(prev + 1)}"
-                )
-                start = i
-                prev = i
-        intervaly.append(
-            f"{ctvrthodina_na_cas(start)}"
-            f"–"
-            f"{ctvrthodina_na_cas(prev + 1)}"
-        )
-    return intervaly
-def odesli_telegram_text(text):
-    if (
-        not TELEGRAM_BOT_TOKEN
-        or not TELEGRAM_CHAT_ID
-    ):
-        print(
-            "⚠️ Telegram není "
-            "nastaven – přeskočeno"
-        )
-        return
-    url = (
-        f"https://api.telegram.org/"
-        f"bot{TELEGRAM_BOT_TOKEN}/"
-        f"sendMessage"
+    # souvislé běhy čtvrthodin: zlom všude, kde rozdíl sousedů není 1
+    zlomy = np.flatnonzero(
+        np.diff(pod) != 1
     )
-    data = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": text
-    }
-    try:
-        resp = requests.post(
-            url,
-            data=data,
-            timeout=HTTP_TIMEOUT
-        )
-        if resp.status_code != 200:
-            print(
-                "⚠️ Telegram API chyba: "
-                f"{resp.text}"
-            )
-    except Exception as e:
-        print(f"⚠️ Telegram výjimka: {e}")
-def odesli_telegram_graf(
-    buf,
-    intervaly
-):
-    if (
-        not TELEGRAM_BOT_TOKEN
-        or not TELEGRAM_CHAT_ID
-    ):
-        print(
-            "⚠️ Telegram není "
-            "nastaven – přeskočeno"
-        )
-        return
-    url = (
-        f"https://api.telegram.org/"
-        f"bot{TELEGRAM_BOT_TOKEN}/"
-        f"sendPhoto"
+    zacatky = np.concatenate(
+        ([pod[0]], pod[zlomy + 1])
     )
-    popis = (
-        "Dnešní cena pod limitem "
-        "v časech:\n"
-        + "\n".join(intervaly)
+    konce = np.concatenate(
+        (pod[zlomy], [pod[-1]])
     )
-    files = {
-        "photo": (
-            "graf.png",
-            buf,
-            "image/png"
-        )
-    }
-    data = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "caption": popis
-    }
-    try:
-        resp = requests.post(
-            url,
-            files=files,
-            data=data,
-            timeout=HTTP_TIMEOUT
-        )
-        if resp.status_code != 200:
-            print(
-                "⚠️ Telegram API chyba: "
-                f"{resp.text}"
-            )
-    except Exception as e:
-        print(f"⚠️ Telegram výjimka: {e}")
+    return [
+        f"{ctvrthodina_na_cas(zacatek)}"
+        f"–"
+        f"{ctvrthodina_na_cas(konec + 1)}"
+        for zacatek, konec in zip(zacatky, konce)
+    ]
 def stahni_data():
-    df = ziskej_data_z_ote()
+    df, znacka = ziskej_data_z_ote()
+    if df is None:
+        log("🏁 Hotovo – data beze změny.")
+        return
     uloz_csv(df)
+    if znacka:
+        # až po zapsaném CSV – pád před uložením nesmí příští běh odbýt 304
+        _uloz_last_modified(znacka)
     intervaly = zjisti_intervaly_pod_limitem(df)
     if intervaly:
         graf_buf = vytvor_graf(df)
-        odesli_telegram_graf(graf_buf, intervaly)
+        popis = (
+            "Dnešní cena pod limitem "
+            "v časech:\n"
+            + "\n".join(intervaly)
+        )
+        posli_foto(graf_buf, popis)
     else:
-        odesli_telegram_text(f"ℹ️ Dnes ({dnes.strftime('%d.%m.%Y')}) žádné ceny pod limitem.")
-    print("🏁 Hotovo.")
+        posli_text(f"ℹ️ Dnes ({dnes.strftime('%d.%m.%Y')}) žádné ceny pod limitem.")
+    log("🏁 Hotovo.")
 if __name__ == "__main__":
     stahni_data()